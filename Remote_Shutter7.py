@@ -11,8 +11,6 @@
 
 import os
 import time
-import wifi
-import espnow
 import board
 import keypad
 import neopixel
@@ -28,6 +26,7 @@ from adafruit_progressbar.horizontalprogressbar import (
     )
 from adafruit_simplemath import map_range
 import supervisor
+import channel_hop
 
 supervisor.runtime.autoreload = False
 
@@ -84,21 +83,14 @@ status_pixel.fill(BLACK)
 D0_key = keypad.Keys((board.D0,), value_when_pressed=False, pull=True)
 D1D2_keys = keypad.Keys((board.D1, board.D2), value_when_pressed=True, pull=False)
 
-# Channel switching hack
-wifi.radio.start_ap(" ", "", channel=6, max_connections=0)
-wifi.radio.stop_ap()
-
-# Initialize ESP-NOW
-e = espnow.ESPNow()
-
+# Initialize ESP-NOW on the home channel, channel_hop moves it to the best one
 if P2P_MODE:
-    memento = espnow.Peer(mac=MEMENTO_MAC, channel=6)
-    e.peers.append(memento)
+    link = channel_hop.EspNowLink(MEMENTO_MAC)
     d_print("Peer to Peer Mode\nmemento MAC added to peer list")
 else:
-    peer = espnow.Peer(mac=b'\xff\xff\xff\xff\xff\xff', channel=6)
-    e.peers.append(peer)
+    link = channel_hop.EspNowLink(b'\xff\xff\xff\xff\xff\xff')
     d_print("Broadcast Mode")
+hopper = channel_hop.RemoteHopper(link)
 
 # Create display main group (will be root group)
 main_group = displayio.Group()
@@ -216,10 +208,7 @@ button_needs_reset = False
 message = None
 receipt = None
 packet = None
-success_count = e.send_success
-fail_count = e.send_failure
-d_print(f"initial run success counter {success_count}")
-d_print(f"initial run fail counter {fail_count}")
+channel = link.channel
 
 while True:
     current_time = time.monotonic()
@@ -250,29 +239,22 @@ while True:
 
     if message:
         try:
-            d_print(f"pre msg send success {e.send_success}")
-            d_print(f"pre msg send failure {e.send_failure}")
-
-            e.send(message, memento)
+            delivered = link.send(message)  # waits a bit for the receipt, None if none came
             print(f"Sent: {message}")
+            hopper.record(delivered)
 
-            time.sleep(0.05)  # wait a bit for message success receipt, need to test range, works at 0.01 on desk
+            d_print(f"send success {link.espnow.send_success}")
+            d_print(f"send failure {link.espnow.send_failure}")
 
-            d_print(f"post msg send success {e.send_success}")
-            d_print(f"post msg send failure {e.send_failure}")
-
-            if e.send_success > success_count:
+            if delivered:
                 # success!
                 receipt_button.label = message.upper()
                 signal_group.hidden = True
                 receipt_group.hidden = False
                 status_reset_time = current_time + 0.75  # Reset after 0.75 seconds
                 status_needs_reset = True
-                success_count = e.send_success
-
-            if e.send_failure > fail_count:
+            elif delivered is False:
                 # fail!
-                fail_count = e.send_failure
                 raise Exception("fail count advanced")
 
         except Exception as ex: # pylint: disable=broad-except
@@ -300,14 +282,20 @@ while True:
     message = None
 
     # check for received packets
-    packet = e.read()
+    packet = link.read()
     if packet:
-        receipt = packet.msg.decode('utf-8')
+        receipt, sig_strength = packet
         d_print(f"received: {receipt}")
-        sig_strength = packet.rssi
         d_print(f"signal strength is {sig_strength}")
-        signal_bar.value = map_range(sig_strength, -127, 0, 0, 100)
-        d_print(f"signal bar value is {signal_bar.value}")
+        if not hopper.handle(receipt, sig_strength, time.monotonic()):
+            signal_bar.value = map_range(sig_strength, -127, 0, 0, 100)
+            d_print(f"signal bar value is {signal_bar.value}")
+
+    # channel survey, rendezvous with the memento and moving when the link degrades
+    hopper.poll(time.monotonic())
+    if link.channel != channel:
+        channel = link.channel
+        print(f"Channel {channel}")
 
 
     packet = None
@@ -0,0 +1,503 @@
+# channel_hop
+# ESP-NOW channel survey, rendezvous and migration for the remote shutter
+# 2025 Jean-Paul Lorrain
+# MIT License
+
+# Copy this file to CIRCUITPY on both the Reverse TFT S3 remote and the Memento.
+# Both boards boot on HOME_CHANNEL. The remote runs RemoteHopper: it scans how
+# busy each channel is, asks the camera for its own scan, picks the quietest
+# channel for both and leads the move there. When the link gets bad it skips
+# the question, since replies rarely get through a crowded channel, and moves
+# on its own scan plus the camera scan it got last time. If it loses the camera
+# it hunts for it channel by channel.
+# The camera runs CameraHopper, which answers and follows, and when it stops
+# hearing the remote's heartbeat it wanders the channels for a few rounds to be
+# found before settling back on HOME_CHANNEL. Answering a channel query means a
+# Wi-Fi scan on the camera too, which stalls the preview for a second or two.
+# channel_sim.py runs this same code against simulated radios on a computer.
+
+import time
+
+try:
+    import wifi
+    import espnow
+except ImportError:  # not on CircuitPython, e.g. running channel_sim.py
+    wifi = None
+    espnow = None
+
+HOME_CHANNEL = 6  # both boards boot here, same as the old channel 6 hack
+CHANNELS = (1, 6, 11)  # non-overlapping 2.4 GHz channels to pick from
+
+# Link quality, judged on the remote from its own sends and the camera replies
+WINDOW = 20  # number of recent results kept
+MIN_SAMPLES = 5
+MIN_DELIVERY = 0.6  # fraction of sends that have to be acknowledged
+MIN_RSSI = -85  # average reply signal strength in dBm
+DEGRADED_PENALTY = 100  # added to the score of a channel we had to leave
+PENALTY_TIME = 60.0  # seconds the penalty sticks
+
+# Handshake timing in seconds
+RETRY_INTERVAL = 1.0  # long enough for the camera to finish its scan
+RETRIES = 4
+MOVE_RETRY_INTERVAL = 0.1  # moving off a bad channel, keep trying fast
+MOVE_RETRIES = 30
+CONFIRM_TIMEOUT = 3.0  # camera goes back if the remote never shows up
+HUNT_DWELL = 0.3
+HUNT_ROUNDS = 3  # then the remote waits on HOME_CHANNEL, pinging at heartbeat rate
+HEARTBEAT = 2.0  # remote pings this often, also keeps the signal bar fresh
+SILENCE_TIMEOUT = 8.0  # camera starts wandering after this long without a word
+WANDER_DWELL = 2.0  # longer than a whole hunt round, so the two meet
+WANDER_ROUNDS = 3  # then the camera goes home and waits there
+COOLDOWN = 10.0  # minimum time between two rendezvous
+SURVEY_MAX_AGE = 5.0  # camera reuses its scan for repeated queries
+
+# Control messages, the camera never echoes these back
+QUERY = "chq"
+SCORES = "chs:"
+MOVE = "chm:"
+ACK = "chk:"
+
+# Remote states
+IDLE = "idle"
+QUERYING = "querying"
+MOVING = "moving"
+CONFIRMING = "confirming"
+HUNTING = "hunting"
+
+
+def set_radio_channel(channel):
+    """Channel switching hack, starting and stopping an AP sets the radio channel."""
+    wifi.radio.start_ap(" ", "", channel=channel, max_connections=0)
+    wifi.radio.stop_ap()
+
+
+def channel_scores(networks, channels=CHANNELS):
+    """Score how busy each channel is from (channel, rssi) pairs, lower is quieter.
+
+    A network counts fully on its own channel and partly on the channels
+    up to 4 away from it, since 2.4 GHz channels overlap."""
+    scores = {}
+    for channel in channels:
+        score = 0
+        for net_channel, rssi in networks:
+            distance = abs(channel - net_channel)
+            if distance < 5:
+                score += max(0, rssi + 100) * (5 - distance) // 5
+        scores[channel] = score
+    return scores
+
+
+def encode_scores(scores):
+    return SCORES + ",".join(f"{channel}={scores[channel]}" for channel in sorted(scores))
+
+
+def decode_scores(message):
+    """Raises ValueError on a garbled message."""
+    scores = {}
+    for item in message[len(SCORES):].split(","):
+        if item:
+            channel, score = item.split("=")
+            scores[int(channel)] = int(score)
+    return scores
+
+
+def best_channel(*score_sets):
+    """Lowest combined score over the channels every side scored, None if there are none."""
+    totals = {}
+    for channel in sorted(score_sets[0]):
+        if all(channel in scores for scores in score_sets):
+            totals[channel] = sum(scores[channel] for scores in score_sets)
+    if not totals:
+        return None
+    return min(sorted(totals), key=lambda channel: totals[channel])
+
+
+class LinkMonitor:
+    """Rolling record of send results and reply signal strength."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.results = []
+        self.rssi = []
+
+    def add_result(self, delivered):
+        self.results.append(bool(delivered))
+        if len(self.results) > self.window:
+            self.results.pop(0)
+
+    def add_rssi(self, rssi):
+        self.rssi.append(rssi)
+        if len(self.rssi) > self.window:
+            self.rssi.pop(0)
+
+    @property
+    def delivery_rate(self):
+        if not self.results:
+            return None
+        return sum(self.results) / len(self.results)
+
+    @property
+    def mean_rssi(self):
+        if not self.rssi:
+            return None
+        return sum(self.rssi) / len(self.rssi)
+
+    def degraded(self):
+        if len(self.results) < MIN_SAMPLES:
+            return False
+        if self.delivery_rate < MIN_DELIVERY:
+            return True
+        return len(self.rssi) >= MIN_SAMPLES and self.mean_rssi < MIN_RSSI
+
+
+class EspNowLink:
+    """ESP-NOW to a single peer, on a channel that can be changed."""
+
+    def __init__(self, mac, channel=HOME_CHANNEL, channels=CHANNELS):
+        self.mac = mac
+        self.channels = channels
+        set_radio_channel(channel)  # before ESPNow(), like the original channel hack
+        self.espnow = espnow.ESPNow()
+        self.peer = espnow.Peer(mac=mac, channel=channel)
+        self.espnow.peers.append(self.peer)
+        self.channel = channel
+        self.seen_success = self.espnow.send_success
+        self.seen_failure = self.espnow.send_failure
+        self.pending = 0  # sends still waiting for a receipt
+
+    def set_channel(self, channel):
+        set_radio_channel(channel)
+        self.espnow.peers.remove(self.peer)
+        self.peer = espnow.Peer(mac=self.mac, channel=channel)
+        self.espnow.peers.append(self.peer)
+        self.channel = channel
+
+    def send(self, message, wait=True):
+        """Send and return True if the success counter went up, False if the
+        failure counter did, or None if no receipt came in time.
+
+        Receipts arrive in order, so late ones settle earlier sends first.
+        With wait=False it returns None right away."""
+        self._receipts()
+        older = self.pending
+        self.espnow.send(message, self.peer)
+        self.pending += 1
+        if not wait:
+            return None
+        time.sleep(0.05)  # wait a bit for message success receipt, works at 0.01 on desk
+        success, failure = self._receipts()
+        if success + failure <= older:
+            return None  # only receipts for earlier sends so far
+        if failure == 0:
+            return True
+        if success == 0:
+            return False
+        return None  # both kinds came in, can't tell which one was ours
+
+    def _receipts(self):
+        success = self.espnow.send_success - self.seen_success
+        failure = self.espnow.send_failure - self.seen_failure
+        self.seen_success += success
+        self.seen_failure += failure
+        self.pending = max(0, self.pending - success - failure)
+        return success, failure
+
+    def read(self):
+        """Return (message, rssi) or None."""
+        packet = self.espnow.read()
+        if packet:
+            return packet.msg.decode("utf-8"), packet.rssi
+        return None
+
+    def survey(self):
+        """Scan for networks and score the channels, takes a second or so."""
+        networks = []
+        for network in wifi.radio.start_scanning_networks(
+            start_channel=min(self.channels), stop_channel=max(self.channels)
+        ):
+            networks.append((network.channel, network.rssi))
+        wifi.radio.stop_scanning_networks()
+        set_radio_channel(self.channel)  # scanning leaves the radio on its last channel
+        return channel_scores(networks, self.channels)
+
+
+class RemoteHopper:
+    """Remote side: picks the channel, leads the move and hunts for a lost camera.
+
+    Call poll() every loop, pass every received message to handle() and
+    the result of every snap/focus/ping send to record()."""
+
+    def __init__(self, link, channels=CHANNELS):
+        self.link = link
+        self.channels = channels
+        self.monitor = LinkMonitor()
+        self.state = IDLE
+        self.needs_rendezvous = True  # agree on a channel right after boot
+        self.degraded = False  # move without asking until the rendezvous is done
+        self.next_attempt = 0
+        self.next_heartbeat = 0
+        self.penalties = {}  # channel: time the penalty runs out
+        self.own_scores = None
+        self.peer_scores = None  # camera scan from the last rendezvous
+        self.target = None
+        self.previous = None
+        self.tries = 0
+        self.next_retry = 0
+        self.hunt_order = ()
+        self.started = None  # first attempt of the rendezvous under way
+        self.handshake_time = None  # seconds the last rendezvous took, retries and hunts included
+        self.rendezvous_count = 0
+        self.migrations = 0
+        self.failed_attempts = 0
+        self.hunts = 0
+
+    @property
+    def busy(self):
+        return self.state != IDLE
+
+    def record(self, delivered):
+        """delivered is what link.send returned, None (no receipt yet) is left out."""
+        if self.state == IDLE and delivered is not None:
+            self.monitor.add_result(delivered)
+
+    def poll(self, now):
+        if self.state == IDLE:
+            if now >= self.next_heartbeat:
+                self.next_heartbeat = now + HEARTBEAT
+                self.record(self._send("ping"))
+            if now < self.next_attempt:
+                return
+            if self.monitor.degraded():
+                self.penalties[self.link.channel] = now + PENALTY_TIME
+                self.needs_rendezvous = True
+                self.degraded = True
+            if self.needs_rendezvous:
+                self._start(now)
+            return
+        if now < self.next_retry:
+            return
+        if self.state == HUNTING:
+            self._hunt(now)
+        elif self.tries >= (MOVE_RETRIES if self.state == MOVING else RETRIES):
+            self.failed_attempts += 1
+            self._lost(now)
+        else:
+            self._retry(now)
+
+    def handle(self, message, rssi, now):
+        """Return True if the message was channel control and not for the app."""
+        if message.startswith(SCORES):
+            if self.state == QUERYING:
+                try:
+                    self.peer_scores = decode_scores(message)
+                except ValueError:
+                    return True
+                self._move(best_channel(self.own_scores, self.peer_scores), now)
+            return True
+        if message.startswith(ACK):
+            if self.state == MOVING and message == ACK + str(self.target):
+                self._switch(now)
+            return True
+        if message == QUERY or message.startswith(MOVE):
+            return True
+
+        # anything else is the camera echoing us, so it is on our channel
+        self.monitor.add_rssi(rssi)
+        if self.state == CONFIRMING:
+            self._done(now, moved=True)
+        elif self.state == HUNTING:
+            self.state = IDLE
+            self.next_attempt = now  # try again to agree on a good channel
+            self.monitor.reset()
+        return False
+
+    def _start(self, now):
+        """Scan and ask the camera for its scan, or when the link is degraded
+        move straight away on our scan and the camera scan we already have."""
+        if self.started is None:
+            self.started = now
+        self.next_attempt = now + COOLDOWN
+        self.own_scores = self._survey()
+        if self.own_scores is None:
+            self.failed_attempts += 1
+            return  # try again after the cooldown
+        for channel, until in self.penalties.items():
+            if until > now and channel in self.own_scores:
+                self.own_scores[channel] += DEGRADED_PENALTY
+        if self.degraded:
+            if self.peer_scores is None:
+                self._move(best_channel(self.own_scores), now)
+            else:
+                self._move(best_channel(self.own_scores, self.peer_scores), now)
+        else:
+            self._enter(QUERYING, now)
+
+    def _move(self, target, now):
+        if target is None or target == self.link.channel:
+            self._done(now, moved=False)
+        else:
+            self.target = target
+            self._enter(MOVING, now)
+
+    def _switch(self, now):
+        self.previous = self.link.channel
+        self.link.set_channel(self.target)
+        self._enter(CONFIRMING, now)
+
+    def _enter(self, state, now):
+        self.state = state
+        self.tries = 0
+        self.next_retry = now
+
+    def _retry(self, now):
+        self.tries += 1
+        self.next_retry = now + RETRY_INTERVAL
+        if self.state == QUERYING:
+            self._send(QUERY)
+        elif self.state == MOVING:
+            self.next_retry = now + MOVE_RETRY_INTERVAL
+            if self._send(MOVE + str(self.target)):
+                self._switch(now)  # the send receipt is enough, no need to wait for the ack
+        else:
+            self._send("ping")  # confirming, the camera echoes it on the new channel
+
+    def _done(self, now, moved):
+        self.state = IDLE
+        self.needs_rendezvous = False
+        self.degraded = False
+        self.handshake_time = now - self.started
+        self.started = None
+        self.rendezvous_count += 1
+        if moved:
+            self.migrations += 1
+        self.monitor.reset()
+
+    def _lost(self, now):
+        """Camera stopped answering, look for it on our channel, where we were
+        moving to, the last one, then the rest."""
+        order = [self.link.channel]
+        for channel in (self.target, self.previous):
+            if channel is not None and channel not in order:
+                order.append(channel)
+        order += [channel for channel in self.channels if channel not in order]
+        self.hunt_order = order
+        self.hunts += 1
+        self.tries = 0
+        self.state = HUNTING
+        self.next_retry = now
+
+    def _hunt(self, now):
+        if self.tries < HUNT_ROUNDS * len(self.hunt_order):
+            channel = self.hunt_order[self.tries % len(self.hunt_order)]
+            self.tries += 1
+            self.next_retry = now + HUNT_DWELL
+        else:
+            channel = HOME_CHANNEL  # camera is probably off, it waits at home too
+            self.next_retry = now + HEARTBEAT
+        if channel != self.link.channel:
+            self.link.set_channel(channel)
+        self._send("ping")
+
+    def _send(self, message):
+        try:
+            return self.link.send(message)
+        except Exception:  # pylint: disable=broad-except
+            return False  # a retry or the hunt takes care of it
+
+    def _survey(self):
+        try:
+            return self.link.survey()
+        except Exception as ex:  # pylint: disable=broad-except
+            print(f"Channel survey failed: {ex}")
+            return None
+
+
+class CameraHopper:
+    """Camera side: answers channel queries and follows the remote to a new channel.
+
+    Call poll() every loop and pass every received message to handle()."""
+
+    def __init__(self, link, channels=CHANNELS):
+        self.link = link
+        self.channels = channels
+        self.last_heard = None  # no wandering before the remote has shown up once
+        self.next_wander = 0
+        self.wanders = 0
+        self.previous = None
+        self.confirm_by = None
+        self.scores = None
+        self.surveyed = None
+        self.query_pending = False  # scan and answer in poll(), not mid-message
+
+    def handle(self, message, now):
+        """Return True if the message was channel control, which is not echoed."""
+        self.last_heard = now
+        self.wanders = 0
+        if message == QUERY:
+            if self.scores is None or now - self.surveyed > SURVEY_MAX_AGE:
+                self.query_pending = True
+            else:
+                self._send(encode_scores(self.scores))
+            return True
+        if message.startswith(MOVE):
+            try:
+                channel = int(message[len(MOVE):])
+            except ValueError:
+                return True
+            if channel not in self.channels:
+                return True
+            self._send(ACK + str(channel))
+            if channel != self.link.channel:
+                self.previous = self.link.channel
+                self.link.set_channel(channel)
+                self.confirm_by = now + CONFIRM_TIMEOUT
+            return True
+        if message.startswith(SCORES) or message.startswith(ACK):
+            return True
+
+        self.confirm_by = None  # the remote made it here
+        return False
+
+    def poll(self, now):
+        if self.query_pending:
+            self.query_pending = False
+            self.scores = self._survey()  # blocks for a second or two
+            self.surveyed = now
+            if self.scores is not None:
+                self._send(encode_scores(self.scores))
+        if self.confirm_by is not None:
+            if now >= self.confirm_by:
+                self.link.set_channel(self.previous)
+                self.confirm_by = None
+            return
+        if self.last_heard is None or now - self.last_heard <= SILENCE_TIMEOUT:
+            return
+        if now < self.next_wander or self.wanders > WANDER_ROUNDS * len(self.channels):
+            return
+        self.next_wander = now + WANDER_DWELL
+        self.wanders += 1
+        if self.wanders > WANDER_ROUNDS * len(self.channels):
+            channel = HOME_CHANNEL  # remote is probably off, wait at home until it is back
+        elif self.link.channel in self.channels:
+            index = self.channels.index(self.link.channel) + 1
+            channel = self.channels[index % len(self.channels)]
+        else:
+            channel = self.channels[0]
+        if channel != self.link.channel:
+            self.link.set_channel(channel)
+
+    def _send(self, message):
+        try:
+            self.link.send(message, wait=False)
+        except Exception:  # pylint: disable=broad-except
+            pass  # the remote retries
+
+    def _survey(self):
+        try:
+            return self.link.survey()
+        except Exception as ex:  # pylint: disable=broad-except
+            print(f"Channel survey failed: {ex}")
+            return None
@@ -0,0 +1,414 @@
+# channel_sim
+# Desktop simulation of channel_hop on several busy 2.4 GHz channels
+# 2025 Jean-Paul Lorrain
+# MIT License
+
+# Runs the remote and camera side of channel_hop against simulated radios,
+# no boards needed:  python3 channel_sim.py --trials 20
+# Partway through, the venue fills up and the channel the pair is on gets
+# crowded. Prints how long the rendezvous handshakes take, counting failed
+# attempts and hunts for the camera up to the one that worked, how often the
+# remote had to hunt, and the delivery
+# rate before the crowd, while stuck in it, and after migrating away, next
+# to the same run without channel hopping.
+# python3 channel_sim.py --selftest checks the channel_hop helpers and the
+# edge cases that keep the boards from crashing, using asserts.
+
+import argparse
+import random
+import types
+
+import channel_hop
+
+TICK = 0.01  # simulation step in seconds
+LATENCY = 0.002
+SURVEY_TIME = 1.2  # a scan keeps the radio off the link this long
+PRESS_INTERVAL = 0.5  # remote sends a ping this often
+
+# networks a scan sees before the crowd shows up
+QUIET_NETWORKS = [(1, -70), (1, -80), (6, -75), (11, -85)]
+
+
+class Medium:
+    """Shared air. Loss on a channel follows how busy a scan says it is."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.time = 0.0
+        self.networks = list(QUIET_NETWORKS)
+        self.crowded = None
+
+    def crowd(self, channel):
+        self.crowded = channel
+        self.networks += [
+            (channel, -45),
+            (channel, -50),
+            (channel, -50),
+            (channel, -55),
+            (min(channel + 1, 13), -60),
+            (max(channel - 1, 1), -65),
+        ]
+
+    def loss(self, channel):
+        score = channel_hop.channel_scores(self.networks, (channel,))[channel]
+        return min(0.95, score / 200)
+
+
+class SimLink:
+    """Stands in for channel_hop.EspNowLink."""
+
+    def __init__(self, medium, channel=channel_hop.HOME_CHANNEL, channels=channel_hop.CHANNELS):
+        self.medium = medium
+        self.channel = channel
+        self.channels = channels
+        self.other = None
+        self.inbox = []
+        self.deaf_until = 0.0
+
+    def deaf(self):
+        return self.medium.time < self.deaf_until
+
+    def set_channel(self, channel):
+        self.channel = channel
+
+    def send(self, message, wait=True):
+        medium = self.medium
+        arrival = max(medium.time, self.deaf_until) + LATENCY
+        other = self.other
+        if other.channel != self.channel or other.deaf_until > arrival:
+            return False
+        if medium.rng.random() < medium.loss(self.channel):
+            return False
+        other.inbox.append((arrival, message, medium.rng.randint(-70, -55)))
+        return True
+
+    def read(self):
+        if self.inbox and self.inbox[0][0] <= self.medium.time:
+            _, message, rssi = self.inbox.pop(0)
+            return message, rssi
+        return None
+
+    def survey(self):
+        self.deaf_until = self.medium.time + SURVEY_TIME
+        return channel_hop.channel_scores(self.medium.networks, self.channels)
+
+
+def run_trial(seed, duration, crowd_at, hop=True):
+    medium = Medium(random.Random(seed))
+    remote_link = SimLink(medium)
+    camera_link = SimLink(medium)
+    remote_link.other = camera_link
+    camera_link.other = remote_link
+    remote = channel_hop.RemoteHopper(remote_link) if hop else None
+    camera = channel_hop.CameraHopper(camera_link) if hop else None
+
+    sends = []  # (time, delivered)
+    handshakes = []  # (finished at, seconds, moved)
+    migrated_at = None  # both settled together off the crowded channel
+    next_press = 1.0
+    while medium.time < duration:
+        now = medium.time
+        if medium.crowded is None and now >= crowd_at:
+            medium.crowd(remote_link.channel)
+
+        if not remote_link.deaf():
+            if now >= next_press:
+                delivered = remote_link.send("ping")
+                sends.append((now, delivered))
+                if remote:
+                    remote.record(delivered)
+                next_press = now + PRESS_INTERVAL
+            packet = remote_link.read()
+            if remote:
+                count, migrations = remote.rendezvous_count, remote.migrations
+                if packet:
+                    remote.handle(packet[0], packet[1], now)
+                remote.poll(now)
+                if remote.rendezvous_count > count:
+                    moved = remote.migrations > migrations
+                    handshakes.append((now, remote.handshake_time, moved))
+                if (
+                    migrated_at is None
+                    and medium.crowded is not None
+                    and not remote.busy
+                    and remote_link.channel == camera_link.channel != medium.crowded
+                ):
+                    migrated_at = now
+
+        if not camera_link.deaf():
+            packet = camera_link.read()
+            if packet:
+                message = packet[0]
+                if not camera or not camera.handle(message, now):
+                    camera_link.send(message)  # echo, like the Memento does
+            if camera:
+                camera.poll(now)
+
+        medium.time = round(now + TICK, 6)
+
+    return {
+        "sends": sends,
+        "handshakes": handshakes,
+        "crowd_at": crowd_at,
+        "migrated_at": migrated_at,
+        "failed_attempts": remote.failed_attempts if remote else 0,
+        "hunts": remote.hunts if remote else 0,
+    }
+
+
+def delivery(sends, start, end):
+    window = [delivered for when, delivered in sends if start <= when < end]
+    if not window:
+        return None
+    return sum(window) / len(window)
+
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return sum(values) / len(values)
+
+
+def fmt(value, unit=""):
+    if value is None:
+        return "n/a"
+    if unit == "%":
+        return f"{value * 100:5.1f}%"
+    return f"{value:5.2f}{unit}"
+
+
+class FakeLink:
+    """Records what the hoppers do, for the self test."""
+
+    def __init__(self, channel=channel_hop.HOME_CHANNEL, reply=True):
+        self.channel = channel
+        self.channels = channel_hop.CHANNELS
+        self.reply = reply
+        self.sent = []
+        self.switches = []
+        self.surveys = 0
+
+    def set_channel(self, channel):
+        self.channel = channel
+        self.switches.append(channel)
+
+    def send(self, message, wait=True):
+        self.sent.append(message)
+        return self.reply
+
+    def survey(self):
+        self.surveys += 1
+        if self.reply is None:
+            raise RuntimeError("scan already in progress")
+        return {1: 50, 6: 25, 11: 15}
+
+
+class FakeESPNow:
+    def __init__(self, log):
+        self.log = log
+        self.log.append("ESPNow")
+        self.peers = []
+        self.send_success = 0
+        self.send_failure = 0
+        self.receipts = []  # (success, failure) that come in during each wait
+
+    def send(self, message, peer):
+        pass
+
+
+def selftest():
+    # scores count overlapping channels
+    assert channel_hop.channel_scores([(6, -50)], (1, 6, 11)) == {1: 0, 6: 50, 11: 0}
+    assert channel_hop.channel_scores([(8, -50)], (6,)) == {6: 30}
+
+    # score messages round trip, garbled ones raise ValueError
+    scores = {1: 50, 6: 25, 11: 15}
+    assert channel_hop.decode_scores(channel_hop.encode_scores(scores)) == scores
+    for garbled in ("chs:1=x", "chs:1", "chs:1=2=3", "chs:a=1"):
+        try:
+            channel_hop.decode_scores(garbled)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(garbled)
+
+    # best channel only counts channels every side scored
+    assert channel_hop.best_channel({1: 5, 6: 1}, {1: 1, 11: 0}) == 1
+    assert channel_hop.best_channel({1: 5}, {11: 0}) is None
+    assert channel_hop.best_channel({1: 3, 6: 3}) == 1
+
+    # link monitor
+    monitor = channel_hop.LinkMonitor()
+    for _ in range(channel_hop.MIN_SAMPLES - 1):
+        monitor.add_result(False)
+    assert not monitor.degraded()
+    monitor.add_result(False)
+    assert monitor.degraded()
+    monitor.reset()
+    for _ in range(channel_hop.MIN_SAMPLES):
+        monitor.add_result(True)
+        monitor.add_rssi(-95)
+    assert monitor.degraded()
+
+    # unknown send results stay out of the monitor
+    remote = channel_hop.RemoteHopper(FakeLink())
+    remote.record(None)
+    assert remote.monitor.results == []
+
+    # camera ignores moves to channels it doesn't use, without an ack
+    link = FakeLink()
+    camera = channel_hop.CameraHopper(link)
+    for message in ("chm:0", "chm:99", "chm:x"):
+        assert camera.handle(message, 0)
+    assert link.sent == [] and link.switches == []
+
+    # camera scans in poll(), not in handle(), and survives a failed scan
+    assert camera.handle(channel_hop.QUERY, 0)
+    assert link.surveys == 0
+    camera.poll(0)
+    assert link.surveys == 1 and link.sent == ["chs:1=50,6=25,11=15"]
+    link.reply = None
+    camera.surveyed = -100
+    camera.handle(channel_hop.QUERY, 0)
+    camera.poll(0)
+    assert link.sent == ["chs:1=50,6=25,11=15"]
+
+    # camera only wanders after hearing the remote, then settles at home
+    link = FakeLink()
+    camera = channel_hop.CameraHopper(link)
+    for now in range(100):
+        camera.poll(now)
+    assert link.switches == []
+    camera.handle("ping", 0)
+    for now in range(200):
+        camera.poll(now)
+    assert link.channel == channel_hop.HOME_CHANNEL
+    assert len(link.switches) <= channel_hop.WANDER_ROUNDS * len(channel_hop.CHANNELS) + 1
+
+    # remote survives a failed scan and waits for the cooldown
+    remote = channel_hop.RemoteHopper(FakeLink(reply=None))
+    remote.poll(0)
+    assert remote.state == channel_hop.IDLE and remote.next_attempt == channel_hop.COOLDOWN
+
+    # remote hunt is bounded, then pings from home at heartbeat rate
+    link = FakeLink(channel=11, reply=False)
+    remote = channel_hop.RemoteHopper(link)
+    remote._lost(0)
+    now = 0.0
+    while now < 60:
+        remote.poll(now)
+        now = round(now + 0.1, 6)
+    rounds = channel_hop.HUNT_ROUNDS * len(channel_hop.CHANNELS)
+    assert link.channel == channel_hop.HOME_CHANNEL
+    assert len(link.switches) <= rounds
+    assert len(link.sent) < rounds + 60 / channel_hop.HEARTBEAT + 2
+
+    # a degraded link moves without asking, also after a hunt found the camera
+    link = FakeLink(reply=False)
+    remote = channel_hop.RemoteHopper(link)
+    remote.needs_rendezvous = False
+    for _ in range(channel_hop.MIN_SAMPLES):
+        remote.record(False)
+    remote.poll(1)
+    assert remote.state == channel_hop.MOVING
+    remote.state = channel_hop.HUNTING
+    remote.handle("ping", -60, 20)
+    link.sent = []
+    remote.poll(20)
+    assert remote.state == channel_hop.MOVING
+    assert channel_hop.QUERY not in link.sent
+
+    # a rendezvous that stays put is still timed
+    remote = channel_hop.RemoteHopper(FakeLink(channel=11))
+    remote.poll(0)
+    remote.handle("chs:1=50,6=25,11=15", -60, 2)
+    assert remote.rendezvous_count == 1 and remote.handshake_time == 2
+
+    # EspNowLink: channel hack before ESPNow(), receipts in three kinds
+    log = []
+    radio = types.SimpleNamespace(
+        start_ap=lambda *args, **kwargs: log.append("start_ap"),
+        stop_ap=lambda: None,
+    )
+    fakes = {
+        "wifi": types.SimpleNamespace(radio=radio),
+        "espnow": types.SimpleNamespace(
+            ESPNow=lambda: FakeESPNow(log),
+            Peer=lambda mac, channel: (mac, channel),
+        ),
+    }
+    saved = channel_hop.wifi, channel_hop.espnow, channel_hop.time
+    channel_hop.wifi, channel_hop.espnow = fakes["wifi"], fakes["espnow"]
+    try:
+        link = channel_hop.EspNowLink(b"\xff" * 6)
+        assert log == ["start_ap", "ESPNow"]
+        radio_espnow = link.espnow
+
+        def sleep(_):
+            success, failure = radio_espnow.receipts.pop(0)
+            radio_espnow.send_success += success
+            radio_espnow.send_failure += failure
+
+        channel_hop.time = types.SimpleNamespace(sleep=sleep)
+        radio_espnow.receipts = [(1, 0), (0, 1), (0, 0), (1, 0), (1, 1)]
+        assert link.send("a") is True
+        assert link.send("b") is False
+        assert link.send("c") is None  # receipt late
+        assert link.send("d") is None  # that success was for "c"
+        assert link.send("e") is None  # settles "d", mixed for "e"
+    finally:
+        channel_hop.wifi, channel_hop.espnow, channel_hop.time = saved
+    print("selftest passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate channel_hop on crowded channels")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--crowd-at", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--selftest", action="store_true", help="run assert checks and exit")
+    args = parser.parse_args()
+    if args.selftest:
+        selftest()
+        return
+
+    boot, migration, reaction = [], [], []
+    before, stuck, after, baseline = [], [], [], []
+    failed = 0
+    failed_attempts = hunts = 0
+    for trial in range(args.trials):
+        seed = args.seed + trial
+        result = run_trial(seed, args.duration, args.crowd_at)
+        sends, crowd_at, migrated_at = result["sends"], result["crowd_at"], result["migrated_at"]
+        for finished, seconds, _ in result["handshakes"]:
+            if finished < crowd_at:
+                boot.append(seconds)
+            else:
+                migration.append(seconds)
+        failed_attempts += result["failed_attempts"]
+        hunts += result["hunts"]
+        before.append(delivery(sends, 2.0, crowd_at))
+        if migrated_at is None:
+            failed += 1
+        else:
+            reaction.append(migrated_at - crowd_at)
+            stuck.append(delivery(sends, crowd_at, migrated_at))
+            after.append(delivery(sends, migrated_at, args.duration))
+        plain = run_trial(seed, args.duration, args.crowd_at, hop=False)
+        baseline.append(delivery(plain["sends"], crowd_at, args.duration))
+
+    print(f"{args.trials} trials, {args.duration:.0f} s each, channel crowded at {args.crowd_at:.0f} s")
+    print(f"boot rendezvous         mean {fmt(mean(boot), ' s')}  max {fmt(max(boot, default=None), ' s')}")
+    print(f"migration handshake     mean {fmt(mean(migration), ' s')}  max {fmt(max(migration, default=None), ' s')}")
+    print(f"failed attempts {failed_attempts}, hunts for the camera {hunts}")
+    print(f"crowd to migrated       mean {fmt(mean(reaction), ' s')}  (no migration in {failed} trials)")
+    print(f"delivery before crowd        {fmt(mean(before), '%')}")
+    print(f"delivery crowded, not moved  {fmt(mean(stuck), '%')}")
+    print(f"delivery after migration     {fmt(mean(after), '%')}")
+    print(f"delivery without hopping     {fmt(mean(baseline), '%')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,9 +30,8 @@ from digitalio import DigitalInOut, Direction, Pull
 
 import jpl_mycamera as adafruit_pycamera
 
-""" ESP-NOW imports """
-import wifi
-import espnow
+""" ESP-NOW imports, copy channel_hop.py to CIRCUITPY too """
+import channel_hop
 
 supervisor.runtime.autoreload = False
 
@@ -69,22 +68,15 @@ curr_setting = 0
 # pin.pull = Pull.UP
 # ext_button = Button(pin, long_duration_ms=1000)
 
-""" wifi hack """
-wifi.radio.start_ap(" ", "", channel=6, max_connections=0)
-wifi.radio.stop_ap()
-
-""" Initialize ESP-NOW """
-e = espnow.ESPNow()
-
-""" peer list creation """
+""" Initialize ESP-NOW and peer on the home channel,
+    the remote picks the best channel and channel_hop follows it """
 if P2P_MODE:
-    reverse_s3 = espnow.Peer(mac=S3_MAC, channel=6)
-    e.peers.append(reverse_s3)
+    link = channel_hop.EspNowLink(S3_MAC)
     print("ESP-NOW Peer to Peer Mode\n Feather S3 Reverse TFT  MAC added to peer list")
 else:
-    peer = espnow.Peer(mac=b'\xff\xff\xff\xff\xff\xff', channel=6)
-    e.peers.append(peer)
+    link = channel_hop.EspNowLink(b'\xff\xff\xff\xff\xff\xff')
     print("ESP-NOW Broadcast Mode")
+hopper = channel_hop.CameraHopper(link)
 
 print("Starting!")
 # pycam.tone(200, 0.1)
@@ -165,12 +157,15 @@ while True:
     pycam.keys_debounce()
     # ext_button.update()
 
-    """ check for incoming packet """
-    if e:
-        packet = e.read()
-        if packet:
-            message = packet.msg.decode('utf-8')
-            print(f"received: {message}")
+    """ check for incoming packet, channel messages are handled by channel_hop """
+    packet = link.read()
+    if packet:
+        message = packet[0]
+        print(f"received: {message}")
+        if hopper.handle(message, time.monotonic()):
+            packet = None
+            message = None
+    hopper.poll(time.monotonic())
 
     # shutter button long press or
     """ focus message """
@@ -270,7 +265,7 @@ while True:
     """ respond to any message (including ping) so remote can read signal strength """
     if message:
         try:
-            e.send(message, reverse_s3)
+            link.send(message, wait=False)  # the remote waits for the receipt, not us
         except Exception as e:
             print(f"ESP-NOW message {message} failed to send to target\n {e}")
         finally: